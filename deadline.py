@@ -0,0 +1,45 @@
+"""
+整次运行的截止时间预算
+
+把总时长按比例分给 fetch / render / send 三个阶段。某阶段提前完成时，
+剩余时间按比例顺延给后续阶段，保证上游卡住时也能留出发送邮件的时间。
+"""
+import time
+
+STAGE_SHARES = (('fetch', 0.3), ('render', 0.1), ('send', 0.6))
+
+
+class DeadlineExceeded(Exception):
+    """运行预算已经用完"""
+
+
+class RunDeadline:
+    """一次运行的时间预算"""
+
+    def __init__(self, total_seconds, shares=STAGE_SHARES):
+        self.total_seconds = total_seconds
+        self.shares = shares
+        self.expires_at = time.monotonic() + total_seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def stage_budget(self, name):
+        """返回该阶段可用的秒数：剩余时间按本阶段及后续阶段的比例分配"""
+        names = [stage for stage, _ in self.shares]
+        later = self.shares[names.index(name):]
+        share = later[0][1] / sum(weight for _, weight in later)
+        budget = self.remaining() * share
+        if budget <= 0:
+            raise DeadlineExceeded(f"运行时间预算已用完，无法进入 {name} 阶段")
+        return budget
+
+    def clamp(self, timeout):
+        """把单次操作的超时限制在剩余预算以内"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("运行时间预算已用完")
+        return min(timeout, remaining) if timeout else remaining
@@ -0,0 +1,90 @@
+"""
+天气 + 每日资讯合并简报
+
+在一个进程中并发获取和风天气、60秒资讯和答案之书，把天气HTML与资讯内容
+合并成一封 multipart 邮件，每个收件人每天只收到一封，并复用同一个SMTP会话投递。
+配置沿用 email_bot.py（和风天气、SMTP、收件人）与 news_bot.py（NEWS_COUNT、LINE_WIDTH 等）的环境变量。
+"""
+import argparse
+import html
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import email_bot
+import news_bot
+from deadline import RunDeadline
+from mail_delivery import render_template
+from profiling import profile_run, stage
+
+
+def fetch_all(deadline):
+    """并发获取天气、60秒资讯和答案之书，返回 (天气原始数据, 资讯数据, 答案数据)"""
+    report = news_bot.DailyReport()
+    timeout = deadline.stage_budget('fetch')
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        weather_future = pool.submit(email_bot.request_weather_json, timeout)
+        daily_future = pool.submit(report.daily_60s.fetch_data, timeout)
+        answer_future = pool.submit(report.answer_book.fetch_data, timeout)
+        return weather_future.result(), daily_future.result(), answer_future.result()
+
+
+def build_news_html(daily_content, answer_content):
+    """把资讯和答案之书的文本排版嵌入天气邮件"""
+    sections = ''.join(
+        f'<pre style="white-space: pre-wrap; font-family: \'Microsoft YaHei\', monospace; '
+        f'font-size: 14px; margin: 0 0 20px;">{html.escape(content.strip())}</pre>'
+        for content in (daily_content, answer_content)
+    )
+    return f'<div style="padding: 0 30px 30px;">{sections}</div>'
+
+
+def build_digest_message(weather_data, daily_content, answer_content):
+    """生成合并后的邮件对象（不含收件人）"""
+    text_content = "\n\n".join([email_bot.generate_weather_text(weather_data), daily_content, answer_content])
+
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = f"🌤️ 每日简报 {datetime.now().strftime('%Y-%m-%d')}"
+    msg['From'] = email_bot.Config.SENDER_EMAIL
+    msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
+    msg.attach(email_bot.build_html_part(weather_data, build_news_html(daily_content, answer_content)))
+    return msg
+
+
+def main():
+    """主函数"""
+    try:
+        print("🚀 开始并发获取天气与每日资讯...")
+        email_bot.Config.validate()
+        deadline = RunDeadline(email_bot.Config.RUN_DEADLINE_SECONDS)
+
+        with stage('fetch'):
+            raw_weather_data, daily_data, answer_data = fetch_all(deadline)
+        with stage('parse'):
+            weather_data = email_bot.parse_weather_data(raw_weather_data)
+        with stage('render'):
+            daily_content, answer_content = news_bot.DailyReport().format_sections(daily_data, answer_data)
+            template = render_template(build_digest_message(weather_data, daily_content, answer_content))
+
+        print(f"📅 预报日期: {weather_data[0]['日期']} - {weather_data[-1]['日期']}")
+        with stage('send'):
+            email_bot.deliver_template(template, deadline)
+        print("🎉 每日简报发送完成!")
+
+    except Exception as e:
+        print(f"❌ 程序执行出错: {e}")
+        raise
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="天气 + 每日资讯合并简报")
+    parser.add_argument('--profile', nargs='?', const='profile-artifacts', metavar='DIR',
+                        help="开启性能剖析并把结果写入DIR (默认 profile-artifacts)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with profile_run(args.profile):
+        main()
@@ -1,18 +1,24 @@
+import argparse
 import os
 import time
 import jwt
-import requests
 import json
-import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from datetime import datetime
+from deadline import RunDeadline
+from http_fetch import hedged_fetch_json
+from mail_delivery import SmtpSettings, deliver, render_template
+from prefetch import ensure_fresh, load_artifact, wait_until, write_artifact
+from recipients import recipient_source
+from profiling import profile_run, stage
+from weather_chart import chart_cid, chart_part
 
 # 从环境变量读取配置信息
 class Config:
     # 和风天气配置
     QWEATHER_PRIVATE_KEY = os.environ.get('QWEATHER_PRIVATE_KEY')
-    QWEATHER_API_HOST = "https://n84nmtek7c.re.qweatherapi.com"
+    QWEATHER_API_HOST = os.environ.get('QWEATHER_API_HOST', 'https://n84nmtek7c.re.qweatherapi.com')
     QWEATHER_LOCATION = os.environ.get('QWEATHER_LOCATION', '114.58,37.51')  
     QWEATHER_SUB = os.environ.get('QWEATHER_SUB')
     QWEATHER_KID = os.environ.get('QWEATHER_KID')
@@ -22,9 +28,35 @@ class Config:
     SENDER_PASSWORD = os.environ.get('SENDER_PASSWORD')
     SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.qq.com')
     SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+    SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'true').lower() == 'true'
     
-    # 收件人列表
+    # 收件人列表，RECIPIENTS_FILE 可指向 CSV / JSONL / SQLite 文件以支持大名单
     RECIPIENTS = os.environ.get('RECIPIENT_EMAILS', '').split(',')
+    RECIPIENTS_FILE = os.environ.get('RECIPIENTS_FILE')
+    RECIPIENTS_SQL = os.environ.get('RECIPIENTS_SQL')
+    RECIPIENT_BATCH_SIZE = int(os.environ.get('RECIPIENT_BATCH_SIZE', '1000'))
+    
+    # 分片投递配置，DELIVERY_WORKERS 大于0时按域名分片多进程发送
+    DELIVERY_WORKERS = int(os.environ.get('DELIVERY_WORKERS', '0'))
+    SMTP_MAX_PER_SESSION = int(os.environ.get('SMTP_MAX_PER_SESSION', '100'))
+    
+    # 投递方式: smtp 直接发送；eml / maildir / mbox 只渲染并写入 EXPORT_DIR，交给外部MTA
+    DELIVERY_MODE = os.environ.get('DELIVERY_MODE', 'smtp').lower()
+    EXPORT_DIR = os.environ.get('EXPORT_DIR', 'outbox')
+    
+    # 超时配置：整次运行的时间预算、上游请求的对冲等待时间（耗时样本不足时使用）、SMTP单次操作超时，
+    # 以及跨运行累积的上游耗时样本文件，用于估计各接口的 p95
+    RUN_DEADLINE_SECONDS = float(os.environ.get('RUN_DEADLINE_SECONDS', '600'))
+    HEDGE_AFTER_SECONDS = float(os.environ.get('HEDGE_AFTER_SECONDS', '1.5'))
+    SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', '30'))
+    LATENCY_STATS_FILE = os.environ.get('LATENCY_STATS_FILE', '.cache/latency/samples.json')
+    
+    # 两阶段投递：提前准备的产物超过该时长视为过期
+    ARTIFACT_MAX_AGE_SECONDS = float(os.environ.get('ARTIFACT_MAX_AGE_SECONDS', '3600'))
+    
+    # 温度与降水趋势图，按预报内容缓存到 CHART_CACHE_DIR
+    ENABLE_CHART = os.environ.get('ENABLE_CHART', 'true').lower() == 'true'
+    CHART_CACHE_DIR = os.environ.get('CHART_CACHE_DIR', '.cache/weather_chart')
     
     @classmethod
     def validate(cls):
@@ -34,6 +66,8 @@ class Config:
             'SENDER_EMAIL', 
             'SENDER_PASSWORD'
         ]
+        if cls.DELIVERY_MODE != 'smtp':
+            required_vars.remove('SENDER_PASSWORD')
         
         missing = []
         for var in required_vars:
@@ -63,9 +97,10 @@ def generate_JWT():
     return encoded_jwt
 
 
-def request_weather_json():
-    """根据生成的jwt request天气数据并返回json数据"""
-    JWT_TOKEN = generate_JWT()
+def request_weather_json(timeout=None):
+    """根据生成的jwt request天气数据并返回json数据，timeout 为整体超时秒数"""
+    with stage('jwt'):
+        JWT_TOKEN = generate_JWT()
 
     # 构建完整URL
     url = f"{Config.QWEATHER_API_HOST}/v7/weather/3d?location={Config.QWEATHER_LOCATION}"
@@ -73,12 +108,12 @@ def request_weather_json():
         'Authorization': f'Bearer {JWT_TOKEN}'
     }
 
-    response = requests.get(url, headers=headers)
-
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"API请求失败，状态码: {response.status_code}")
+    with stage('http'):
+        data, _ = hedged_fetch_json(
+            url, headers=headers, timeout=timeout,
+            hedge_after=Config.HEDGE_AFTER_SECONDS, stats_file=Config.LATENCY_STATS_FILE
+        )
+    return data
 
 
 def parse_weather_data(raw_data):
@@ -111,9 +146,10 @@ def parse_weather_data(raw_data):
     return parsed_list
 
 
-def generate_weather_email(data):
+def generate_weather_email(data, extra_content='', chart_cid=None):
     """
-    根据天气数据生成美化的HTML邮件内容
+    根据天气数据生成美化的HTML邮件内容，extra_content 为插入在页脚前的额外HTML，
+    chart_cid 为内联趋势图的 Content-ID
     """
     # HTML模板
     html_template = '''
@@ -154,6 +190,14 @@ def generate_weather_email(data):
                 font-size: 18px;
                 opacity: 0.9;
             }}
+            .chart {{
+                padding: 30px 30px 0;
+                text-align: center;
+            }}
+            .chart img {{
+                width: 100%;
+                max-width: 600px;
+            }}
             .days-container {{
                 display: grid;
                 grid-template-columns: repeat(auto-fit, minmax(280px, 1fr));
@@ -270,10 +314,14 @@ def generate_weather_email(data):
                 <div class="date-range">{start_date} - {end_date}</div>
             </div>
             
+            {chart_content}
+            
             <div class="days-container">
                 {days_content}
             </div>
             
+            {extra_content}
+            
             <div class="footer">
                 数据更新时间: {update_time} | 祝你度过愉快的一天! 🌈
             </div>
@@ -393,27 +441,39 @@ def generate_weather_email(data):
     start_date = data[0]["日期"]
     end_date = data[-1]["日期"]
     update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    chart_content = f'<div class="chart"><img src="cid:{chart_cid}" alt="温度与降水趋势"></div>' if chart_cid else ''
 
     # 填充模板
     final_html = html_template.format(
         start_date=start_date,
         end_date=end_date,
+        chart_content=chart_content,
         days_content=days_content,
+        extra_content=extra_content,
         update_time=update_time
     )
 
     return final_html
 
 
-def send_weather_email(recipient_email, weather_data):
+def build_html_part(weather_data, extra_content=''):
     """
-    发送天气邮件
+    生成HTML部分；开启趋势图时返回 multipart/related，图片以 cid: 引用并复用缓存的编码结果
     """
+    if not Config.ENABLE_CHART:
+        return MIMEText(generate_weather_email(weather_data, extra_content), 'html', 'utf-8')
     
-    # 生成HTML内容
-    html_content = generate_weather_email(weather_data)
-    
-    # 创建纯文本备选内容
+    cid = chart_cid(weather_data, Config.SENDER_EMAIL)
+    related = MIMEMultipart('related', type='text/html')
+    related.attach(MIMEText(generate_weather_email(weather_data, extra_content, cid), 'html', 'utf-8'))
+    related.attach(chart_part(weather_data, Config.CHART_CACHE_DIR, cid))
+    return related
+
+
+def generate_weather_text(weather_data):
+    """
+    生成纯文本备选内容
+    """
     text_content = f"""天气预报报告 ({weather_data[0]['日期']} - {weather_data[-1]['日期']})"""
     for day in weather_data:
         text_content += f"""
@@ -426,29 +486,87 @@ def send_weather_email(recipient_email, weather_data):
                         风向: 白天{day['白天风向']}{day['白天风力等级']}, 夜晚{day['夜晚风向']}{day['夜晚风力等级']}
                         
                         """
+    return text_content
+
+
+def build_weather_message(weather_data):
+    """
+    生成天气邮件对象（不含收件人）
+    """
+    
+    # 创建纯文本备选内容
+    text_content = generate_weather_text(weather_data)
     
     # 创建邮件对象
     msg = MIMEMultipart('alternative')
     msg['Subject'] = f"📊 天气预报 {weather_data[0]['日期']} - {weather_data[-1]['日期']}"
     msg['From'] = Config.SENDER_EMAIL
-    msg['To'] = recipient_email
     
     # 添加两种格式的内容
     part1 = MIMEText(text_content, 'plain', 'utf-8')
-    part2 = MIMEText(html_content, 'html', 'utf-8')
+    part2 = build_html_part(weather_data)
     msg.attach(part1)
     msg.attach(part2)
-    
+    return msg
+
+
+def smtp_settings():
+    """根据配置生成SMTP投递参数"""
+    return SmtpSettings(
+        Config.SMTP_SERVER, Config.SMTP_PORT, Config.SENDER_EMAIL, Config.SENDER_PASSWORD,
+        Config.SMTP_STARTTLS, Config.SMTP_MAX_PER_SESSION, Config.SMTP_TIMEOUT
+    )
+
+
+def fetch_weather_template(deadline):
+    """获取天气数据并渲染为所有收件人共用的邮件模板，返回 (模板, 解析后的数据)"""
+    with stage('fetch'):
+        raw_weather_data = request_weather_json(timeout=deadline.stage_budget('fetch'))
+    with stage('parse'):
+        weather_data = parse_weather_data(raw_weather_data)
+    with stage('render'):
+        template = render_template(build_weather_message(weather_data))
+    return template, weather_data
+
+
+def deliver_template(template, deadline):
+    """投递已渲染好的邮件模板，返回是否至少投递了一封"""
+    recipients = recipient_source(Config.RECIPIENTS_FILE, Config.RECIPIENTS, Config.RECIPIENTS_SQL)
+    success = deliver(
+        template, recipients, smtp_settings(), Config.DELIVERY_MODE, Config.DELIVERY_WORKERS,
+        Config.RECIPIENT_BATCH_SIZE, deadline, Config.EXPORT_DIR
+    )
+    recipients.print_summary()
+    return success
+
+
+def prepare(artifact_path):
+    """准备阶段：获取、解析并渲染邮件，写入待发送产物"""
+    print("🚀 准备阶段: 开始获取天气数据...")
+    Config.validate()
+    template, weather_data = fetch_weather_template(RunDeadline(Config.RUN_DEADLINE_SECONDS))
+    write_artifact(
+        artifact_path, 'weather', template,
+        start_date=weather_data[0]['日期'], end_date=weather_data[-1]['日期']
+    )
+
+
+def send_prepared(artifact_path, send_at=None):
+    """发送阶段：读取产物并在目标时间投递，产物不存在时才回退为现场获取"""
+    Config.validate()
     try:
-        # 连接SMTP服务器并发送
-        server = smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT)
-        server.starttls()
-        server.login(Config.SENDER_EMAIL, Config.SENDER_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-        print(f"✅ 天气邮件已成功发送至 {recipient_email}")
-    except Exception as e:
-        print(f"❌ 发送失败: {e}")
+        template, meta = load_artifact(artifact_path, 'weather')
+        print(f"📅 预报日期: {meta['start_date']} - {meta['end_date']}")
+    except FileNotFoundError:
+        print(f"⚠️  未找到产物 {artifact_path}，回退为现场获取天气数据")
+        template, _ = fetch_weather_template(RunDeadline(Config.RUN_DEADLINE_SECONDS))
+        meta = None
+    
+    wait_until(send_at)
+    if meta is not None:
+        ensure_fresh(artifact_path, meta, Config.ARTIFACT_MAX_AGE_SECONDS)
+    with stage('send'):
+        deliver_template(template, RunDeadline(Config.RUN_DEADLINE_SECONDS))
 
 
 def main():
@@ -458,19 +576,17 @@ def main():
         
         # 验证配置
         Config.validate()
+        deadline = RunDeadline(Config.RUN_DEADLINE_SECONDS)
         
-        # 获取真实天气数据
-        raw_weather_data = request_weather_json()
-        weather_data_for_email = parse_weather_data(raw_weather_data)
+        # 获取真实天气数据，邮件只渲染一次
+        template, weather_data_for_email = fetch_weather_template(deadline)
         
         print("📊 天气数据获取成功!")
         print(f"📅 预报日期: {weather_data_for_email[0]['日期']} - {weather_data_for_email[-1]['日期']}")
         
-        # 发送给所有收件人
-        for recipient in Config.RECIPIENTS:
-            if recipient.strip():
-                print(f"📨 正在发送邮件给: {recipient.strip()}")
-                send_weather_email(recipient.strip(), weather_data_for_email)
+        # 发送给所有收件人，与发送阶段共用同一套投递逻辑
+        with stage('send'):
+            deliver_template(template, deadline)
                 
         print("🎉 所有邮件发送完成!")
         
@@ -479,5 +595,23 @@ def main():
         raise
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="和风天气邮件机器人")
+    parser.add_argument('--profile', nargs='?', const='profile-artifacts', metavar='DIR',
+                        help="开启性能剖析并把结果写入DIR (默认 profile-artifacts)")
+    phase = parser.add_mutually_exclusive_group()
+    phase.add_argument('--prepare', metavar='ARTIFACT', help="准备阶段：获取并渲染邮件，写入产物文件")
+    phase.add_argument('--send-prepared', metavar='ARTIFACT', help="发送阶段：读取产物文件并投递")
+    parser.add_argument('--send-at', metavar='HH:MM', help="发送阶段的目标时间 (UTC)，默认立即发送")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    with profile_run(args.profile):
+        if args.prepare:
+            prepare(args.prepare)
+        elif args.send_prepared:
+            send_prepared(args.send_prepared, args.send_at)
+        else:
+            main()
\ No newline at end of file
@@ -0,0 +1,254 @@
+"""
+上游接口的JSON获取
+
+请求时声明 Accept-Encoding（gzip / deflate，安装了 brotli 时还包括 br），
+以压缩形式传输响应，并按块流式解压到一个缓冲区，再交给 json.loads。
+注意 json.loads 收到字节时内部仍会先解码成完整的 str，解析阶段的拷贝数与
+read() -> decode() -> loads() 相同；节省的是线上传输量和一次性读入压缩正文的开销。
+每次请求都会记录线上传输字节数与解压后字节数。
+
+hedged_fetch_json 在首个请求超过该接口的 p95 延迟后再发出一个相同请求，
+取先返回的结果，用来削平上游的长尾延迟。每次运行每个接口只请求一两次，
+所以耗时样本保存在 stats_file 中跨运行累积；样本不足时使用固定的 hedge_after。
+"""
+import http.client
+import json
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from urllib.parse import urlsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHUNK_SIZE = 64 * 1024
+
+FetchStats = namedtuple('FetchStats', ['status', 'encoding', 'wire_bytes', 'decoded_bytes', 'elapsed'])
+
+
+class FetchError(Exception):
+    """上游返回非200状态码"""
+
+    def __init__(self, status):
+        super().__init__(f"API请求失败，状态码: {status}")
+        self.status = status
+
+
+def accept_encoding():
+    encodings = ['gzip', 'deflate']
+    if brotli is not None:
+        encodings.insert(0, 'br')
+    return ', '.join(encodings)
+
+
+def _deflate_decompressor():
+    """deflate 响应既可能带 zlib 封装也可能是裸 deflate 流，按首个数据块的头部判断"""
+    decompressobj = None
+
+    def process(chunk):
+        nonlocal decompressobj
+        if decompressobj is None:
+            zlib_wrapped = len(chunk) >= 2 and chunk[0] & 0x0F == 8 and int.from_bytes(chunk[:2], 'big') % 31 == 0
+            decompressobj = zlib.decompressobj(zlib.MAX_WBITS if zlib_wrapped else -zlib.MAX_WBITS)
+        return decompressobj.decompress(chunk)
+
+    return process
+
+
+def _decompressor(encoding):
+    """返回一个 process(chunk) -> bytes 的解压函数，identity 时返回 None"""
+    if encoding in ('', 'identity'):
+        return None
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+    if encoding == 'deflate':
+        return _deflate_decompressor()
+    if encoding == 'br' and brotli is not None:
+        return brotli.Decompressor().process
+    raise ValueError(f"不支持的内容编码: {encoding}")
+
+
+def open_connection(url, timeout=None):
+    parts = urlsplit(url)
+    if parts.scheme == 'https':
+        conn = http.client.HTTPSConnection(parts.netloc, timeout=timeout)
+    else:
+        conn = http.client.HTTPConnection(parts.netloc, timeout=timeout)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return conn, path
+
+
+def fetch_json(url, headers=None, timeout=None, expires_at=None):
+    """
+    GET 一个 JSON 接口，返回 (解析后的数据, FetchStats)
+    timeout 为单次套接字操作的超时；给定 expires_at（time.monotonic 时刻）时，
+    每次读写前都把超时收紧到剩余时间，整个请求不会超过该时刻
+    """
+    request_headers = {'Accept': 'application/json', 'Accept-Encoding': accept_encoding()}
+    request_headers.update(headers or {})
+
+    def op_timeout():
+        if expires_at is None:
+            return timeout
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"{urlsplit(url).path} 超过截止时间")
+        return min(timeout, remaining) if timeout else remaining
+
+    started = time.perf_counter()
+    conn, path = open_connection(url, op_timeout())
+    try:
+        conn.request('GET', path, headers=request_headers)
+        # 响应带 Connection: close 时 getresponse 后 conn.sock 会被置空，先保留引用
+        sock = conn.sock
+        sock.settimeout(op_timeout())
+        res = conn.getresponse()
+        encoding = (res.getheader('Content-Encoding') or '').strip().lower()
+        if res.status != 200:
+            res.read()
+            raise FetchError(res.status)
+
+        decompress = _decompressor(encoding)
+        body = bytearray()
+        wire_bytes = 0
+        while not res.isclosed():
+            sock.settimeout(op_timeout())
+            chunk = res.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            wire_bytes += len(chunk)
+            body += decompress(chunk) if decompress is not None else chunk
+    finally:
+        conn.close()
+
+    data = json.loads(body)
+    stats = FetchStats(res.status, encoding or 'identity', wire_bytes, len(body), time.perf_counter() - started)
+    print(f"🌐 {urlsplit(url).path}: 传输 {stats.wire_bytes / 1024:.1f} KiB / "
+          f"解码 {stats.decoded_bytes / 1024:.1f} KiB ({stats.encoding}, {stats.elapsed * 1000:.0f}ms)")
+    return data, stats
+
+
+class LatencyTracker:
+    """按接口记录最近的成功请求耗时，用于估计 p95；关联文件后样本会跨运行持久化"""
+
+    def __init__(self, window=200, min_samples=10):
+        self.min_samples = min_samples
+        self.path = None
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def attach(self, path):
+        """载入 path 中的历史样本，之后每次记录都写回该文件；重复调用同一路径时不做任何事"""
+        with self._lock:
+            if path == self.path:
+                return
+            self.path = path
+            try:
+                with open(path, encoding='utf-8') as f:
+                    saved = json.load(f)
+            except FileNotFoundError:
+                return
+            except (OSError, ValueError) as e:
+                print(f"⚠️  无法读取延迟样本 {path}: {e}")
+                return
+            for key, samples in saved.items():
+                current = self._samples[key]
+                merged = deque(samples, maxlen=current.maxlen)
+                merged.extend(current)
+                self._samples[key] = merged
+
+    def record(self, key, elapsed):
+        with self._lock:
+            self._samples[key].append(elapsed)
+            if self.path:
+                self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({key: list(samples) for key, samples in self._samples.items()}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️  无法保存延迟样本 {self.path}: {e}")
+
+    def p95(self, key):
+        """样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples[key])
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+latency_tracker = LatencyTracker()
+
+def _submit(fn, *args):
+    """
+    在守护线程中运行 fn 并返回 Future；被放弃的请求不会在解释器退出时被等待，
+    不使用 ThreadPoolExecutor 是因为它的工作线程会在退出时被 join
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='hedge', daemon=True).start()
+    return future
+
+
+def hedged_fetch_json(url, headers=None, timeout=None, hedge_after=1.5, stats_file=None):
+    """
+    带对冲的 fetch_json：首个请求超过 p95（样本不足时用 hedge_after）仍未返回时，
+    再发出一个相同请求，返回先成功的结果；timeout 为整体超时，
+    stats_file 为跨运行保存耗时样本的文件
+    """
+    if stats_file:
+        latency_tracker.attach(stats_file)
+    parts = urlsplit(url)
+    key = parts.netloc + parts.path
+    delay = latency_tracker.p95(key) or hedge_after
+    expires_at = time.monotonic() + timeout if timeout else None
+
+    def remaining():
+        return None if expires_at is None else max(0.0, expires_at - time.monotonic())
+
+    first_started = time.monotonic()
+    original = _submit(fetch_json, url, headers, timeout, expires_at)
+    pending = {original}
+    done, _ = wait(pending, timeout=delay if timeout is None else min(delay, timeout))
+    if not done and (expires_at is None or remaining() > 0):
+        print(f"⏳ {parts.path} 超过 {delay:.2f}s 未返回，发出对冲请求")
+        pending.add(_submit(fetch_json, url, headers, remaining(), expires_at))
+
+    last_error = None
+    while pending:
+        done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            try:
+                data, stats = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            # 对冲请求胜出时，原请求至少已经耗时这么久；只记录对冲自身的耗时会让 p95 逐次偏低
+            latency_tracker.record(key, stats.elapsed if future is original else time.monotonic() - first_started)
+            return data, stats
+
+    if last_error is not None and not pending:
+        raise last_error
+    raise TimeoutError(f"{parts.path} 在 {timeout:.1f}s 内未返回")
@@ -0,0 +1,470 @@
+"""
+离线端到端压测工具
+
+在本地启动和风天气接口、60秒资讯接口和SMTP收件服务的替身，
+然后直接驱动 email_bot.main()、news_bot.main() 与 digest_bot.main() 完整流程，
+最后输出吞吐量、单封邮件延迟 (p50/p99) 以及失败统计。
+
+用法示例:
+    python load_test.py --recipients 10000 --smtp-latency 0.01 --smtp-error-rate 0.02
+"""
+import argparse
+import base64
+import contextlib
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+RECIPIENT_DOMAINS = ['qq.com', '163.com', 'gmail.com', 'outlook.com', '126.com']
+
+
+def fake_weather_payload():
+    """构造与和风天气 /v7/weather/3d 结构一致的数据"""
+    today = date.today()
+    daily = []
+    for offset in range(3):
+        daily.append({
+            'fxDate': (today + timedelta(days=offset)).isoformat(),
+            'textDay': random.choice(['晴', '多云', '小雨', '阴']),
+            'textNight': random.choice(['晴', '多云', '中雨', '阴']),
+            'tempMax': str(random.randint(20, 35)),
+            'tempMin': str(random.randint(5, 19)),
+            'windDirDay': '东南风',
+            'windScaleDay': '1-3',
+            'windSpeedDay': '10',
+            'windDirNight': '南风',
+            'windScaleNight': '1-3',
+            'windSpeedNight': '8',
+            'precip': f"{random.uniform(0, 20):.1f}",
+            'uvIndex': str(random.randint(0, 11)),
+            'humidity': str(random.randint(30, 90)),
+            'vis': '25',
+            'moonPhase': random.choice(['新月', '上弦月', '满月', '下弦月']),
+            'pressure': '1012',
+            'cloud': '25',
+        })
+    return {'code': '200', 'daily': daily}
+
+
+def fake_news_payload():
+    """构造与 /v2/60s 结构一致的数据"""
+    return {
+        'code': 200,
+        'data': {
+            'date': date.today().isoformat(),
+            'lunar_date': '九月初一',
+            'day_of_week': '星期一',
+            'news': [f"压测新闻第{i}条：本地替身接口返回的模拟资讯内容" for i in range(1, 21)],
+        },
+    }
+
+
+def fake_answer_payload():
+    """构造与 /v2/answer 结构一致的数据"""
+    return {
+        'code': 200,
+        'data': {'answer': '答案就在你心中', 'answer_en': 'The answer lies within you'},
+    }
+
+
+class FakeApiServer:
+    """模拟上游HTTP接口，支持延迟和错误率配置"""
+
+    def __init__(self, routes, latency=0.0, error_rate=0.0, tail_rate=0.0, tail_latency=0.0):
+        self.routes = routes
+        self.latency = latency
+        self.error_rate = error_rate
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.requests = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def host(self):
+        """返回 host:port 形式的地址"""
+        return f"127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                with server._lock:
+                    server.requests[path] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if random.random() < server.tail_rate:
+                    time.sleep(server.tail_latency)
+
+                factory = server.routes.get(path)
+                if factory is None:
+                    self._reply(404, {'code': 404})
+                    return
+                if random.random() < server.error_rate:
+                    with server._lock:
+                        server.errors[path] += 1
+                    self._reply(500, {'code': 500})
+                    return
+                self._reply(200, factory())
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body)
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class SmtpSink:
+    """本地SMTP收件服务，只统计不投递，支持延迟、错误率和限流"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, throttle=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.accepted = 0
+        self.rejected = Counter()
+        self.sessions = 0
+        self.latencies = []
+        self._recent = deque()
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _throttled(self):
+        """滑动窗口限流：每秒最多接受 throttle 封邮件"""
+        if not self.throttle:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.throttle:
+                return True
+            self._recent.append(now)
+        return False
+
+    def _record_accept(self, latency):
+        with self._lock:
+            self.accepted += 1
+            self.latencies.append(latency)
+
+    def _record_reject(self, reason):
+        with self._lock:
+            self.rejected[reason] += 1
+
+    def _make_handler(self):
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, *lines):
+                self.wfile.write(b''.join(line.encode('ascii') + b'\r\n' for line in lines))
+
+            def readline(self):
+                return self.rfile.readline().decode('utf-8', 'replace').rstrip('\r\n')
+
+            def handle(self):
+                with sink._lock:
+                    sink.sessions += 1
+                txn_start = time.perf_counter()
+                if sink.latency:
+                    time.sleep(sink.latency)
+                self.reply('220 loadtest ESMTP ready')
+
+                while True:
+                    line = self.readline()
+                    verb, _, arg = line.partition(' ')
+                    verb = verb.upper()
+
+                    if verb in ('EHLO', 'HELO'):
+                        if verb == 'HELO':
+                            self.reply('250 loadtest')
+                        else:
+                            self.reply(
+                                '250-loadtest',
+                                '250-AUTH PLAIN LOGIN',
+                                '250-8BITMIME',
+                                '250 SIZE 52428800',
+                            )
+                    elif verb == 'AUTH':
+                        self._auth(arg)
+                    elif verb == 'STARTTLS':
+                        self.reply('454 4.7.0 TLS not available')
+                    elif verb == 'MAIL':
+                        if sink._throttled():
+                            sink._record_reject('限流')
+                            self.reply('451 4.7.1 Rate limit exceeded, slow down')
+                        else:
+                            self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        while True:
+                            data_line = self.rfile.readline()
+                            if not data_line or data_line in (b'.\r\n', b'.\n'):
+                                break
+                        if sink.latency:
+                            time.sleep(sink.latency)
+                        if random.random() < sink.error_rate:
+                            sink._record_reject('服务端错误')
+                            self.reply('451 4.3.0 Temporary failure')
+                        else:
+                            sink._record_accept(time.perf_counter() - txn_start)
+                            self.reply('250 OK queued')
+                        txn_start = time.perf_counter()
+                    elif verb in ('RSET', 'NOOP'):
+                        txn_start = time.perf_counter()
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    elif not line:
+                        return
+                    else:
+                        self.reply('502 5.5.2 Command not recognized')
+
+            def _auth(self, arg):
+                mechanism, _, initial = arg.partition(' ')
+                mechanism = mechanism.upper()
+                if mechanism == 'PLAIN':
+                    if not initial:
+                        self.reply('334 ')
+                        self.readline()
+                    self.reply('235 2.7.0 Authentication successful')
+                elif mechanism == 'LOGIN':
+                    self.reply('334 ' + base64.b64encode(b'Username:').decode())
+                    self.readline()
+                    self.reply('334 ' + base64.b64encode(b'Password:').decode())
+                    self.readline()
+                    self.reply('235 2.7.0 Authentication successful')
+                else:
+                    self.reply('504 5.5.4 Unrecognized authentication type')
+
+        return Handler
+
+
+def generate_recipients(count):
+    """生成分布在常见邮箱域名上的收件人"""
+    return [f"user{i}@{RECIPIENT_DOMAINS[i % len(RECIPIENT_DOMAINS)]}" for i in range(count)]
+
+
+def generate_private_key():
+    """为JWT签名生成临时Ed25519私钥"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+    key = Ed25519PrivateKey.generate()
+    return key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode('ascii')
+
+
+def configure_bots(weather_api, news_api, sink, recipients, workers, cache_dir, hedge_after=None):
+    """把两个机器人的配置指向本地替身服务，延迟样本和趋势图缓存写入 cache_dir 而不是仓库的 .cache"""
+    import digest_bot
+    import email_bot
+    import news_bot
+
+    email_bot.Config.QWEATHER_API_HOST = f"http://{weather_api.host}"
+    email_bot.Config.QWEATHER_PRIVATE_KEY = generate_private_key()
+    email_bot.Config.QWEATHER_SUB = 'loadtest'
+    email_bot.Config.QWEATHER_KID = 'loadtest'
+    email_bot.Config.SENDER_EMAIL = 'bot@loadtest.local'
+    email_bot.Config.SENDER_PASSWORD = 'loadtest'
+    email_bot.Config.SMTP_SERVER = '127.0.0.1'
+    email_bot.Config.SMTP_PORT = sink.port
+    email_bot.Config.SMTP_STARTTLS = False
+    email_bot.Config.RECIPIENTS = list(recipients)
+    email_bot.Config.DELIVERY_WORKERS = workers
+    email_bot.Config.LATENCY_STATS_FILE = os.path.join(cache_dir, 'latency.json')
+    email_bot.Config.CHART_CACHE_DIR = os.path.join(cache_dir, 'weather_chart')
+
+    news_bot.Config.NEWS_API_HOST = news_api.host
+    news_bot.Config.NEWS_API_HTTPS = False
+    news_bot.Config.SENDER_EMAIL = 'bot@loadtest.local'
+    news_bot.Config.SENDER_PASSWORD = 'loadtest'
+    news_bot.Config.SMTP_SERVER = '127.0.0.1'
+    news_bot.Config.SMTP_PORT = sink.port
+    news_bot.Config.SMTP_STARTTLS = False
+    news_bot.Config.RECEIVER_EMAILS = ','.join(recipients)
+    news_bot.Config.ENABLE_EMAIL = True
+    news_bot.Config.DELIVERY_WORKERS = workers
+    news_bot.Config.LATENCY_STATS_FILE = os.path.join(cache_dir, 'latency.json')
+
+    if hedge_after is not None:
+        email_bot.Config.HEDGE_AFTER_SECONDS = hedge_after
+        news_bot.Config.HEDGE_AFTER_SECONDS = hedge_after
+
+    return {'weather': email_bot.main, 'news': news_bot.main, 'digest': digest_bot.main}
+
+
+def percentile(values, pct):
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_pipeline(name, entry, sink, expected, verbose):
+    """运行一次完整流程并统计结果"""
+    accepted_before = sink.accepted
+    rejected_before = sum(sink.rejected.values())
+    latencies_before = len(sink.latencies)
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    error = None
+    start = time.perf_counter()
+    with output:
+        try:
+            entry()
+        except Exception as e:
+            error = e
+    elapsed = time.perf_counter() - start
+
+    accepted = sink.accepted - accepted_before
+    rejected = sum(sink.rejected.values()) - rejected_before
+    latencies = sink.latencies[latencies_before:]
+    return {
+        'name': name,
+        'elapsed': elapsed,
+        'accepted': accepted,
+        'rejected': rejected,
+        'unreached': max(0, expected - accepted - rejected),
+        'throughput': accepted / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'error': error,
+    }
+
+
+def print_report(results, sink, weather_api, news_api):
+    print("\n" + "=" * 50)
+    print("压测报告")
+    print("=" * 50)
+    for result in results:
+        print(f"[{result['name']}]")
+        print(f"  总耗时: {result['elapsed']:.2f}s")
+        print(f"  成功投递: {result['accepted']}")
+        print(f"  服务端拒收: {result['rejected']}")
+        print(f"  未到达SMTP: {result['unreached']}")
+        print(f"  吞吐量: {result['throughput']:.1f} 封/秒")
+        print(f"  单封延迟: p50={result['p50'] * 1000:.1f}ms p99={result['p99'] * 1000:.1f}ms")
+        if result['error']:
+            print(f"  流程异常: {result['error']}")
+    print("-" * 50)
+    print(f"SMTP会话数: {sink.sessions}")
+    if sink.rejected:
+        print(f"拒收原因: {dict(sink.rejected)}")
+    print(f"天气接口请求: {sum(weather_api.requests.values())} (错误 {sum(weather_api.errors.values())})")
+    print(f"资讯接口请求: {sum(news_api.requests.values())} (错误 {sum(news_api.errors.values())})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="离线端到端压测")
+    parser.add_argument('--bot', choices=['weather', 'news', 'digest', 'all'], default='all', help="要压测的机器人")
+    parser.add_argument('--recipients', type=int, default=1000, help="收件人数量")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="上游接口响应延迟(秒)")
+    parser.add_argument('--api-error-rate', type=float, default=0.0, help="上游接口返回500的概率")
+    parser.add_argument('--api-tail-rate', type=float, default=0.0, help="上游接口出现长尾延迟的概率")
+    parser.add_argument('--api-tail-latency', type=float, default=0.0, help="长尾延迟的额外时长(秒)")
+    parser.add_argument('--hedge-after', type=float, default=None, help="覆盖机器人的对冲等待时间(秒)")
+    parser.add_argument('--smtp-latency', type=float, default=0.0, help="SMTP问候及DATA响应延迟(秒)")
+    parser.add_argument('--smtp-error-rate', type=float, default=0.0, help="SMTP拒收邮件的概率")
+    parser.add_argument('--smtp-throttle', type=int, default=0, help="SMTP每秒最多接收的邮件数，0为不限")
+    parser.add_argument('--workers', type=int, default=0, help="分片投递进程数，0为逐个发送")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子")
+    parser.add_argument('--verbose', action='store_true', help="显示机器人自身的输出")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    weather_api = FakeApiServer(
+        {'/v7/weather/3d': fake_weather_payload},
+        latency=args.api_latency, error_rate=args.api_error_rate,
+        tail_rate=args.api_tail_rate, tail_latency=args.api_tail_latency,
+    ).start()
+    news_api = FakeApiServer(
+        {'/v2/60s': fake_news_payload, '/v2/answer': fake_answer_payload},
+        latency=args.api_latency, error_rate=args.api_error_rate,
+        tail_rate=args.api_tail_rate, tail_latency=args.api_tail_latency,
+    ).start()
+    sink = SmtpSink(
+        latency=args.smtp_latency, error_rate=args.smtp_error_rate, throttle=args.smtp_throttle,
+    ).start()
+
+    cache_dir = tempfile.mkdtemp(prefix='load_test-')
+    try:
+        recipients = generate_recipients(args.recipients)
+        pipelines = configure_bots(weather_api, news_api, sink, recipients, args.workers, cache_dir, args.hedge_after)
+        names = ['weather', 'news', 'digest'] if args.bot == 'all' else [args.bot]
+
+        print(f"🚀 开始压测: {', '.join(names)}，收件人 {len(recipients)} 个")
+        results = [
+            run_pipeline(name, pipelines[name], sink, len(recipients), args.verbose)
+            for name in names
+        ]
+        print_report(results, sink, weather_api, news_api)
+    finally:
+        sink.stop()
+        news_api.stop()
+        weather_api.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+按收件人域名分片的多进程邮件投递
+
+邮件在父进程中只渲染一次，收件人按域名分组后分配到进程池，
+每个工作进程维护自己的SMTP会话，投递结果最终汇总成一份报告。
+给定运行预算时，每个收件人发送前都会检查剩余时间，SMTP超时也被限制在剩余预算以内。
+"""
+import multiprocessing
+import smtplib
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from deadline import DeadlineExceeded
+from recipients import batched
+
+SmtpSettings = namedtuple(
+    'SmtpSettings', ['server', 'port', 'sender', 'password', 'starttls', 'max_per_session', 'timeout'],
+    defaults=[None]
+)
+
+DEADLINE_SKIPPED = '运行时间预算已用完，未发送'
+
+
+def render_template(message):
+    """把邮件对象渲染为不含 To 头的 CRLF 字节串，供所有收件人复用"""
+    del message['To']
+    return message.as_bytes(policy=message.policy.clone(linesep='\r\n'))
+
+
+def personalize(template, recipient, linesep=b'\r\n', headers=b''):
+    """在渲染好的模板前加上收件人头部，headers 为额外的、已按 linesep 结尾的头部行"""
+    return b'To: ' + recipient.encode('utf-8') + linesep + headers + template
+
+
+def recipient_domain(recipient):
+    return recipient.rpartition('@')[2].lower()
+
+
+def plan_shards(recipients, workers):
+    """
+    将收件人按域名分组后分配到各分片
+    同一域名尽量落在同一分片并保持相邻，过大的域名按平均负载切块
+    """
+    groups = OrderedDict()
+    for recipient in recipients:
+        groups.setdefault(recipient_domain(recipient), []).append(recipient)
+
+    total = sum(len(group) for group in groups.values())
+    if not total:
+        return []
+    chunk_size = max(1, -(-total // workers))
+
+    chunks = []
+    for group in groups.values():
+        for start in range(0, len(group), chunk_size):
+            chunks.append(group[start:start + chunk_size])
+
+    # 大块优先放入当前负载最小的分片
+    shards = [[] for _ in range(min(workers, len(chunks)))]
+    for chunk in sorted(chunks, key=len, reverse=True):
+        min(shards, key=len).extend(chunk)
+    return shards
+
+
+class _Session:
+    """工作进程内可复用的SMTP会话，达到单会话上限或断开后自动重连"""
+
+    def __init__(self, settings, deadline=None):
+        self.settings = settings
+        self.deadline = deadline
+        self.server = None
+        self.sent = 0
+
+    def _timeout(self):
+        """单次操作的超时，给定 deadline 时不超过剩余预算，预算用完时抛出 DeadlineExceeded"""
+        if self.deadline is None:
+            return self.settings.timeout
+        return self.deadline.clamp(self.settings.timeout)
+
+    def _connect(self):
+        settings = self.settings
+        timeout = self._timeout()
+        if timeout:
+            self.server = smtplib.SMTP(settings.server, settings.port, timeout=timeout)
+        else:
+            self.server = smtplib.SMTP(settings.server, settings.port)
+        if settings.starttls:
+            self.server.starttls()
+        self.server.login(settings.sender, settings.password)
+        self.sent = 0
+
+    def send(self, recipient, data):
+        if self.server is None or (self.settings.max_per_session and self.sent >= self.settings.max_per_session):
+            self.close()
+            self._connect()
+        elif self.deadline is not None:
+            self.server.sock.settimeout(self._timeout())
+        try:
+            self.server.sendmail(self.settings.sender, [recipient], data)
+        except smtplib.SMTPServerDisconnected:
+            self.server = None
+            self._connect()
+            self.server.sendmail(self.settings.sender, [recipient], data)
+        self.sent += 1
+
+    def close(self):
+        if self.server is not None:
+            try:
+                if self.deadline is not None and self.deadline.expired():
+                    self.server.close()
+                else:
+                    self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+
+def deliver_shard(settings, template, recipients, deadline=None):
+    """
+    在单个进程中投递一个分片，返回 (收件人, 错误信息或None) 列表
+    给定 deadline 时预算用完后剩余收件人记为 DEADLINE_SKIPPED
+    """
+    session = _Session(settings, deadline)
+    results = []
+    try:
+        for index, recipient in enumerate(recipients):
+            if deadline is not None and deadline.expired():
+                results.extend((skipped, DEADLINE_SKIPPED) for skipped in recipients[index:])
+                break
+            try:
+                session.send(recipient, personalize(template, recipient))
+                results.append((recipient, None))
+            except DeadlineExceeded:
+                results.extend((skipped, DEADLINE_SKIPPED) for skipped in recipients[index:])
+                break
+            except (smtplib.SMTPException, OSError) as e:
+                results.append((recipient, str(e)))
+                if session.server is not None:
+                    try:
+                        session.server.rset()
+                    except (smtplib.SMTPException, OSError):
+                        session.server = None
+    finally:
+        session.close()
+    return results
+
+
+class DeliveryReport:
+    """汇总各分片的投递结果"""
+
+    def __init__(self):
+        self.sent = 0
+        self.skipped = 0
+        self.failures = []
+        self.per_domain = Counter()
+
+    @property
+    def total(self):
+        return self.sent + self.skipped + len(self.failures)
+
+    def add(self, results):
+        for recipient, error in results:
+            self.per_domain[recipient_domain(recipient)] += 1
+            if error is None:
+                self.sent += 1
+            elif error == DEADLINE_SKIPPED:
+                self.skipped += 1
+            else:
+                self.failures.append((recipient, error))
+
+    def print_summary(self, limit=20):
+        print(f"🎉 投递完成！成功 {self.sent}/{self.total}")
+        domains = ', '.join(f"{domain}:{count}" for domain, count in self.per_domain.most_common(10))
+        print(f"📊 域名分布: {domains}")
+        if self.skipped:
+            print(f"⏰ 运行时间预算已用完，{self.skipped} 个收件人未发送")
+        for recipient, error in self.failures[:limit]:
+            print(f"❌ 发送给 {recipient} 失败: {error}")
+        if len(self.failures) > limit:
+            print(f"❌ 另有 {len(self.failures) - limit} 个收件人发送失败")
+
+
+def deliver_sharded(settings, template, recipients, workers, batch_size=1000, deadline=None):
+    """
+    按域名分片后用进程池投递，返回汇总报告
+    recipients 可以是任意可迭代对象，按 batch_size 分批读取，进程池在各批次间复用；
+    给定 deadline 时，预算用完后不再提交新的批次，各分片也在每个收件人发送前检查剩余预算
+    """
+    report = DeliveryReport()
+    pool = None
+    try:
+        for batch in batched(recipients, batch_size):
+            if deadline is not None and deadline.expired():
+                print("⏰ 运行时间预算已用完，停止提交剩余批次")
+                break
+            shards = plan_shards(batch, workers)
+            if pool is None:
+                # 父进程此时可能有对冲请求、剖析采样等线程持有锁，不能直接 fork
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+            print(f"📧 分片投递: 本批 {len(batch)} 个收件人，{len(shards)} 个分片")
+            futures = [pool.submit(deliver_shard, settings, template, shard, deadline) for shard in shards]
+            for future in futures:
+                report.add(future.result())
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return report
+
+
+def deliver_serial(settings, template, recipients, batch_size=1000, deadline=None):
+    """在当前进程中复用一个SMTP会话逐个投递，返回汇总报告"""
+    report = DeliveryReport()
+    for batch in batched(recipients, batch_size):
+        if deadline is not None and deadline.expired():
+            print("⏰ 运行时间预算已用完，停止发送剩余邮件")
+            break
+        report.add(deliver_shard(settings, template, batch, deadline))
+    return report
+
+
+def deliver(template, recipients, settings, mode='smtp', workers=0, batch_size=1000, deadline=None, export_dir=None):
+    """
+    投递已渲染好的邮件模板，按 mode / workers 选择导出、分片或单会话发送，返回是否至少投递了一封
+    mode 为 smtp 以外的导出格式时写入 export_dir，不连接SMTP
+    """
+    if mode != 'smtp':
+        from mail_export import export_messages  # mail_export 依赖本模块的 personalize
+        return export_messages(template, recipients, mode, export_dir, settings.sender) > 0
+
+    if workers > 0:
+        report = deliver_sharded(settings, template, recipients, workers, batch_size, deadline)
+    else:
+        report = deliver_serial(settings, template, recipients, batch_size, deadline)
+    report.print_summary()
+    return report.sent > 0
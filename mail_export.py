@@ -0,0 +1,150 @@
+"""
+把渲染好的邮件批量写成 .eml / Maildir / mbox，交给外部MTA投递
+
+邮件模板只渲染一次，每个收件人只在前面加上 To、Date 和唯一的 Message-ID 头；
+整个过程不建立任何SMTP连接，外部中继不必再补这些头部。
+输出目录中同时写入 manifest.jsonl，记录每个收件人对应的文件（mbox 为偏移量）；
+重新导出到同一目录前，会先删除上一批清单中仍未被取走的邮件，避免MTA重复发送。
+"""
+import json
+import os
+import re
+import secrets
+import socket
+import time
+from email.utils import formatdate
+
+from mail_delivery import personalize
+
+EXPORT_FORMATS = ('eml', 'maildir', 'mbox')
+
+WRITE_BUFFER_SIZE = 1 << 20
+
+_MBOX_FROM_LINE = re.compile(rb'^(>*From )', re.MULTILINE)
+
+
+class _Stamp:
+    """为一批导出的邮件生成统一的 Date 头和每个收件人唯一的 Message-ID"""
+
+    def __init__(self, sender):
+        self.date = formatdate(localtime=True)
+        self.domain = (sender or '').rpartition('@')[2] or socket.getfqdn()
+        self.prefix = f"{int(time.time())}.{os.getpid()}.{secrets.token_hex(4)}"
+
+    def headers(self, index, linesep):
+        return (
+            f"Date: {self.date}".encode('ascii') + linesep
+            + f"Message-ID: <{self.prefix}.{index}@{self.domain}>".encode('utf-8') + linesep
+        )
+
+
+def _write_file(path, data):
+    with open(path, 'wb', buffering=0) as f:
+        f.write(data)
+
+
+def _export_eml(template, recipients, directory, manifest, sender, stamp):
+    for index, recipient in enumerate(recipients, 1):
+        name = f"{index:06d}.eml"
+        data = personalize(template, recipient, headers=stamp.headers(index, b'\r\n'))
+        _write_file(os.path.join(directory, name), data)
+        manifest.write({'recipient': recipient, 'file': name})
+
+
+def _export_maildir(template, recipients, directory, manifest, sender, stamp):
+    for sub in ('tmp', 'new', 'cur'):
+        os.makedirs(os.path.join(directory, sub), exist_ok=True)
+
+    template = template.replace(b'\r\n', b'\n')
+    prefix = f"{int(time.time())}.P{os.getpid()}Q"
+    host = socket.gethostname().replace('/', '\\057').replace(':', '\\072')
+    for index, recipient in enumerate(recipients, 1):
+        name = f"{prefix}{index}.{host}"
+        tmp_path = os.path.join(directory, 'tmp', name)
+        _write_file(tmp_path, personalize(template, recipient, b'\n', stamp.headers(index, b'\n')))
+        os.rename(tmp_path, os.path.join(directory, 'new', name))
+        manifest.write({'recipient': recipient, 'file': os.path.join('new', name)})
+
+
+def _export_mbox(template, recipients, directory, manifest, sender, stamp):
+    # mboxrd 格式：正文中以 From 开头的行前加 >
+    template = _MBOX_FROM_LINE.sub(rb'>\1', template.replace(b'\r\n', b'\n'))
+    if not template.endswith(b'\n'):
+        template += b'\n'
+    separator = f"From {sender or 'MAILER-DAEMON'} {time.asctime(time.gmtime())}\n".encode('utf-8')
+
+    offset = 0
+    with open(os.path.join(directory, 'batch.mbox'), 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        for index, recipient in enumerate(recipients, 1):
+            data = separator + personalize(template, recipient, b'\n', stamp.headers(index, b'\n')) + b'\n'
+            f.write(data)
+            manifest.write({'recipient': recipient, 'file': 'batch.mbox', 'offset': offset})
+            offset += len(data)
+
+
+class _Manifest:
+    """收件人清单，按行写入 JSON"""
+
+    def __init__(self, path):
+        self._file = open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+        self.count = 0
+
+    def write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+def _clear_previous_batch(directory):
+    """删除上一批清单中列出、仍留在目录里的邮件文件，返回删除的数量"""
+    manifest_path = os.path.join(directory, 'manifest.jsonl')
+    if not os.path.exists(manifest_path):
+        return 0
+
+    files = set()
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                files.add(json.loads(line)['file'])
+
+    removed = 0
+    root = os.path.realpath(directory)
+    for name in files:
+        path = os.path.realpath(os.path.join(directory, name))
+        if os.path.commonpath([root, path]) == root and os.path.isfile(path):
+            os.remove(path)
+            removed += 1
+    os.remove(manifest_path)
+    return removed
+
+
+_EXPORTERS = {
+    'eml': _export_eml,
+    'maildir': _export_maildir,
+    'mbox': _export_mbox,
+}
+
+
+def export_messages(template, recipients, fmt, directory, sender=None):
+    """
+    将模板按收件人导出到目录，返回写出的邮件数量
+    template 为 mail_delivery.render_template 的结果
+    """
+    if fmt not in _EXPORTERS:
+        raise ValueError(f"不支持的导出格式: {fmt}，可选: {', '.join(EXPORT_FORMATS)}")
+
+    os.makedirs(directory, exist_ok=True)
+    removed = _clear_previous_batch(directory)
+    if removed:
+        print(f"🧹 已删除上一批未被取走的 {removed} 个邮件文件")
+
+    manifest = _Manifest(os.path.join(directory, 'manifest.jsonl'))
+    try:
+        _EXPORTERS[fmt](template, recipients, directory, manifest, sender, _Stamp(sender))
+    finally:
+        manifest.close()
+
+    print(f"📦 已导出 {manifest.count} 封邮件到 {directory} ({fmt})")
+    return manifest.count
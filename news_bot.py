@@ -1,21 +1,47 @@
-import http.client
-import json
-import smtplib
+import argparse
 import os
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from deadline import RunDeadline
+from http_fetch import hedged_fetch_json
+from mail_delivery import SmtpSettings, deliver, render_template
+from prefetch import ensure_fresh, load_artifact, wait_until, write_artifact
+from recipients import RecipientStream, recipient_source
+from profiling import profile_run, stage
 
 # 从环境变量读取配置
 class Config:
     SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.qq.com')
     SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+    SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
     SENDER_EMAIL = os.getenv('SENDER_EMAIL', '')
     SENDER_PASSWORD = os.getenv('SENDER_PASSWORD', '')
     RECEIVER_EMAILS = os.getenv('RECEIVER_EMAILS', '')  # 逗号分隔的邮箱列表
+    RECIPIENTS_FILE = os.getenv('RECIPIENTS_FILE')  # CSV / JSONL / SQLite 收件人文件，适合大名单
+    RECIPIENTS_SQL = os.getenv('RECIPIENTS_SQL')
+    RECIPIENT_BATCH_SIZE = int(os.getenv('RECIPIENT_BATCH_SIZE', '1000'))
     NEWS_COUNT = int(os.getenv('NEWS_COUNT', '15'))
     LINE_WIDTH = int(os.getenv('LINE_WIDTH', '36'))
     ENABLE_EMAIL = os.getenv('ENABLE_EMAIL', 'true').lower() == 'true'
+    DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', '0'))  # 大于0时按域名分片多进程发送
+    SMTP_MAX_PER_SESSION = int(os.getenv('SMTP_MAX_PER_SESSION', '100'))
+    SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))  # SMTP单次操作超时
+    RUN_DEADLINE_SECONDS = float(os.getenv('RUN_DEADLINE_SECONDS', '600'))  # 整次运行的时间预算
+    HEDGE_AFTER_SECONDS = float(os.getenv('HEDGE_AFTER_SECONDS', '1.5'))  # 上游耗时样本不足时，慢于此值即发出对冲请求
+    LATENCY_STATS_FILE = os.getenv('LATENCY_STATS_FILE', '.cache/latency/samples.json')  # 上游耗时样本，跨运行估计 p95
+    ARTIFACT_MAX_AGE_SECONDS = float(os.getenv('ARTIFACT_MAX_AGE_SECONDS', '3600'))  # 两阶段投递产物的有效期
+    DELIVERY_MODE = os.getenv('DELIVERY_MODE', 'smtp').lower()  # smtp / eml / maildir / mbox
+    EXPORT_DIR = os.getenv('EXPORT_DIR', 'outbox')
+    NEWS_API_HOST = os.getenv('NEWS_API_HOST', '60s.viki.moe')
+    NEWS_API_HTTPS = os.getenv('NEWS_API_HTTPS', 'true').lower() == 'true'
+
+
+def _api_url(host, endpoint):
+    """按配置拼接资讯接口地址"""
+    scheme = 'https' if Config.NEWS_API_HTTPS else 'http'
+    return f"{scheme}://{host}{endpoint}"
 
 
 class ChineseTextFormatter:
@@ -85,21 +111,16 @@ class Daily60s:
     """每日60秒资讯类"""
     
     def __init__(self):
-        self.base_url = "60s.viki.moe"
+        self.base_url = Config.NEWS_API_HOST
         self.endpoint = "/v2/60s"
     
-    def fetch_data(self):
+    def fetch_data(self, timeout=None):
         """获取60秒资讯数据"""
         try:
-            conn = http.client.HTTPSConnection(self.base_url)
-            payload = ''
-            headers = {}
-            conn.request("GET", self.endpoint, payload, headers)
-            res = conn.getresponse()
-            data = res.read()
-            data_json = data.decode("utf-8")
-            dic_data = json.loads(data_json)
-            conn.close()
+            dic_data, _ = hedged_fetch_json(
+                _api_url(self.base_url, self.endpoint), timeout=timeout,
+                hedge_after=Config.HEDGE_AFTER_SECONDS, stats_file=Config.LATENCY_STATS_FILE
+            )
             return dic_data
         except Exception as e:
             print(f"获取60秒资讯失败: {e}")
@@ -205,21 +226,16 @@ class AnswerBook:
     """答案之书类"""
     
     def __init__(self):
-        self.base_url = "60s.viki.moe"
+        self.base_url = Config.NEWS_API_HOST
         self.endpoint = "/v2/answer"
     
-    def fetch_data(self):
+    def fetch_data(self, timeout=None):
         """获取答案之书数据"""
         try:
-            conn = http.client.HTTPSConnection(self.base_url)
-            payload = ''
-            headers = {}
-            conn.request("GET", self.endpoint, payload, headers)
-            res = conn.getresponse()
-            data = res.read()
-            data_json = data.decode("utf-8")
-            dic_data = json.loads(data_json)
-            conn.close()
+            dic_data, _ = hedged_fetch_json(
+                _api_url(self.base_url, self.endpoint), timeout=timeout,
+                hedge_after=Config.HEDGE_AFTER_SECONDS, stats_file=Config.LATENCY_STATS_FILE
+            )
             return dic_data
         except Exception as e:
             print(f"获取答案之书失败: {e}")
@@ -264,6 +280,13 @@ class AnswerBook:
 """
 
 
+def _as_recipient_stream(receivers):
+    """把逗号分隔的字符串转换为去重、校验后的收件人流"""
+    if isinstance(receivers, RecipientStream):
+        return receivers
+    return recipient_source(inline=receivers)
+
+
 class EmailSender:
     """邮件发送类"""
     
@@ -273,54 +296,39 @@ class EmailSender:
         self.sender_email = Config.SENDER_EMAIL
         self.sender_password = Config.SENDER_PASSWORD
     
-    def send_email_to_list(self, receiver_emails_str, subject, content):
-        """发送邮件到多个收件人"""
-        try:
-            # 检查必要的配置
-            if not self.sender_email or not self.sender_password:
-                print("❌ 邮箱配置不完整，无法发送邮件")
-                return False
-            
-            # 解析收件人列表
-            receiver_emails = [email.strip() for email in receiver_emails_str.split(',') if email.strip()]
-            
-            if not receiver_emails:
-                print("❌ 未配置收件人邮箱")
-                return False
-            
-            print(f"📧 准备发送邮件给 {len(receiver_emails)} 个收件人: {', '.join(receiver_emails)}")
-            
-            success_count = 0
-            for receiver_email in receiver_emails:
-                try:
-                    # 创建邮件对象
-                    message = MIMEMultipart()
-                    message["From"] = self.sender_email
-                    message["To"] = receiver_email
-                    message["Subject"] = subject
-                    
-                    # 使用纯文本格式，确保中文显示正常
-                    message.attach(MIMEText(content, "plain", "utf-8"))
-                    
-                    # 连接SMTP服务器并发送邮件
-                    server = smtplib.SMTP(self.smtp_server, self.port)
-                    server.starttls()  # 启用TLS加密
-                    server.login(self.sender_email, self.sender_password)
-                    server.sendmail(self.sender_email, receiver_email, message.as_string())
-                    server.quit()
-                    
-                    print(f"✅ 邮件发送成功给: {receiver_email}")
-                    success_count += 1
-                    
-                except Exception as e:
-                    print(f"❌ 发送给 {receiver_email} 失败: {e}")
-            
-            print(f"🎉 邮件发送完成！成功发送给 {success_count}/{len(receiver_emails)} 个收件人")
-            return success_count > 0
-            
-        except Exception as e:
-            print(f"❌ 邮件发送失败: {e}")
+    def send_email_to_list(self, receivers, subject, content, deadline=None):
+        """发送邮件到多个收件人，receivers 为逗号分隔的字符串或 RecipientStream"""
+        # 检查必要的配置
+        if not self.sender_email or not self.sender_password:
+            print("❌ 邮箱配置不完整，无法发送邮件")
             return False
+        
+        template = render_template(self._build_message(subject, content))
+        return self.deliver_template(template, receivers, deadline)
+    
+    def _build_message(self, subject, content):
+        """创建不含收件人的邮件对象"""
+        message = MIMEMultipart()
+        message["From"] = self.sender_email
+        message["Subject"] = subject
+        message.attach(MIMEText(content, "plain", "utf-8"))
+        return message
+    
+    def _smtp_settings(self):
+        return SmtpSettings(
+            self.smtp_server, self.port, self.sender_email, self.sender_password,
+            Config.SMTP_STARTTLS, Config.SMTP_MAX_PER_SESSION, Config.SMTP_TIMEOUT
+        )
+    
+    def deliver_template(self, template, receivers, deadline=None):
+        """投递已渲染好的邮件模板，返回是否至少投递了一封"""
+        receiver_emails = _as_recipient_stream(receivers)
+        success = deliver(
+            template, receiver_emails, self._smtp_settings(), Config.DELIVERY_MODE, Config.DELIVERY_WORKERS,
+            Config.RECIPIENT_BATCH_SIZE, deadline, Config.EXPORT_DIR
+        )
+        receiver_emails.print_summary()
+        return success
 
 
 class DailyReport:
@@ -330,23 +338,44 @@ class DailyReport:
         self.daily_60s = Daily60s()
         self.answer_book = AnswerBook()
     
-    def generate_report(self):
-        """生成中文优化报告"""
+    def generate_report(self, deadline=None, require_all=False):
+        """
+        生成中文优化报告，两个接口并发获取，给定 deadline 时各自都有完整的 fetch 阶段预算
+        require_all 为 True 时任一接口获取失败即抛出 RuntimeError，而不是生成带错误提示的报告
+        """
         print("🔄 正在获取每日数据...")
         
         # 获取数据
-        daily_data = self.daily_60s.fetch_data()
-        answer_data = self.answer_book.fetch_data()
+        with stage('fetch'):
+            daily_data, answer_data = self.fetch_all(deadline.stage_budget('fetch') if deadline is not None else None)
         
-        # 格式化数据
-        daily_content = self.daily_60s.format_data(daily_data) if daily_data else "❌ 无法获取60秒资讯"
-        answer_content = self.answer_book.format_data(answer_data) if answer_data else "❌ 无法获取答案之书"
+        if require_all:
+            missing = [name for name, data in (("60秒资讯", daily_data), ("答案之书", answer_data)) if not data]
+            if missing:
+                raise RuntimeError(f"{'、'.join(missing)}获取失败，不生成报告")
         
-        # 生成完整报告
-        template = self._create_complete_template(daily_content, answer_content)
+        with stage('render'):
+            # 格式化数据
+            daily_content, answer_content = self.format_sections(daily_data, answer_data)
+            
+            # 生成完整报告
+            template = self._create_complete_template(daily_content, answer_content)
         
         return template
     
+    def fetch_all(self, timeout=None):
+        """并发获取60秒资讯和答案之书，返回 (资讯数据, 答案数据)"""
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            daily_future = pool.submit(self.daily_60s.fetch_data, timeout)
+            answer_future = pool.submit(self.answer_book.fetch_data, timeout)
+            return daily_future.result(), answer_future.result()
+    
+    def format_sections(self, daily_data, answer_data):
+        """格式化60秒资讯和答案之书两部分内容"""
+        daily_content = self.daily_60s.format_data(daily_data) if daily_data else "❌ 无法获取60秒资讯"
+        answer_content = self.answer_book.format_data(answer_data) if answer_data else "❌ 无法获取答案之书"
+        return daily_content, answer_content
+    
     def _create_complete_template(self, daily_content, answer_content):
         """创建完整报告模板"""
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -364,13 +393,91 @@ class DailyReport:
         return template
 
 
+def _configured_recipients():
+    """根据配置创建收件人流，优先使用 RECIPIENTS_FILE"""
+    return recipient_source(Config.RECIPIENTS_FILE, Config.RECEIVER_EMAILS, Config.RECIPIENTS_SQL)
+
+
+def _email_enabled():
+    """检查邮件开关与必要配置（导出模式不需要邮箱密码），不满足时打印提示并返回 False"""
+    needs_password = Config.DELIVERY_MODE == 'smtp'
+    has_recipients = Config.RECEIVER_EMAILS or Config.RECIPIENTS_FILE
+    if Config.ENABLE_EMAIL and Config.SENDER_EMAIL and (Config.SENDER_PASSWORD or not needs_password) and has_recipients:
+        return True
+    
+    print("ℹ️  邮件功能未启用或配置不完整")
+    if not Config.ENABLE_EMAIL:
+        print("💡 设置 ENABLE_EMAIL=true 启用邮件发送")
+    if not Config.SENDER_EMAIL:
+        print("💡 请配置 SENDER_EMAIL")
+    if needs_password and not Config.SENDER_PASSWORD:
+        print("💡 请配置 SENDER_PASSWORD")
+    if not has_recipients:
+        print("💡 请配置 RECEIVER_EMAILS (多个邮箱用逗号分隔) 或 RECIPIENTS_FILE")
+    return False
+
+
+def _news_subject():
+    return f"📰 每日资讯 - {datetime.now().strftime('%Y-%m-%d')}"
+
+
+def _render_report(report_content):
+    """把报告渲染为所有收件人共用的邮件模板，返回 (模板, 主题)"""
+    subject = _news_subject()
+    with stage('render'):
+        template = render_template(EmailSender()._build_message(subject, report_content))
+    return template, subject
+
+
+def _render_report_template(deadline, require_all=False):
+    """生成报告并渲染为邮件模板，返回 (模板, 主题)"""
+    return _render_report(DailyReport().generate_report(deadline, require_all))
+
+
+def _deliver(template, deadline):
+    """按配置投递渲染好的模板，main 与发送阶段共用"""
+    with stage('send'):
+        success = EmailSender().deliver_template(template, _configured_recipients(), deadline)
+    if not success:
+        print("❌ 邮件发送失败，请检查配置")
+
+
+def prepare(artifact_path):
+    """
+    准备阶段：获取并渲染报告，写入待发送产物
+    任一接口获取失败时直接报错退出、不写产物，让发送阶段回退为现场获取
+    """
+    template, subject = _render_report_template(RunDeadline(Config.RUN_DEADLINE_SECONDS), require_all=True)
+    write_artifact(artifact_path, 'news', template, subject=subject)
+
+
+def send_prepared(artifact_path, send_at=None):
+    """发送阶段：读取产物并在目标时间投递，产物不存在时才回退为现场获取"""
+    if not _email_enabled():
+        return
+    
+    try:
+        template, meta = load_artifact(artifact_path, 'news')
+    except FileNotFoundError:
+        print(f"⚠️  未找到产物 {artifact_path}，回退为现场获取资讯")
+        template, _ = _render_report_template(RunDeadline(Config.RUN_DEADLINE_SECONDS))
+        meta = None
+    
+    wait_until(send_at)
+    if meta is not None:
+        ensure_fresh(artifact_path, meta, Config.ARTIFACT_MAX_AGE_SECONDS)
+    _deliver(template, RunDeadline(Config.RUN_DEADLINE_SECONDS))
+
+
 def main():
     """主函数"""
+    deadline = RunDeadline(Config.RUN_DEADLINE_SECONDS)
+    
     # 创建报告生成器
     report_generator = DailyReport()
     
     # 生成报告
-    report_content = report_generator.generate_report()
+    report_content = report_generator.generate_report(deadline)
     
     # 在控制台打印结果
     print("\n" + "=" * 50)
@@ -378,25 +485,31 @@ def main():
     print("=" * 50)
     print(report_content)
     
-    # 发送邮件
-    if Config.ENABLE_EMAIL and Config.SENDER_EMAIL and Config.SENDER_PASSWORD and Config.RECEIVER_EMAILS:
-        email_sender = EmailSender()
-        subject = f"📰 每日资讯 - {datetime.now().strftime('%Y-%m-%d')}"
-        success = email_sender.send_email_to_list(Config.RECEIVER_EMAILS, subject, report_content)
-        
-        if not success:
-            print("❌ 邮件发送失败，请检查配置")
-    else:
-        print("ℹ️  邮件功能未启用或配置不完整")
-        if not Config.ENABLE_EMAIL:
-            print("💡 设置 ENABLE_EMAIL=true 启用邮件发送")
-        if not Config.SENDER_EMAIL:
-            print("💡 请配置 SENDER_EMAIL")
-        if not Config.SENDER_PASSWORD:
-            print("💡 请配置 SENDER_PASSWORD")
-        if not Config.RECEIVER_EMAILS:
-            print("💡 请配置 RECEIVER_EMAILS (多个邮箱用逗号分隔)")
+    if not _email_enabled():
+        return
+    
+    # 发送邮件（或按 DELIVERY_MODE 导出），与发送阶段共用同一套渲染和投递逻辑
+    template, _ = _render_report(report_content)
+    _deliver(template, deadline)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="每日60秒资讯机器人")
+    parser.add_argument('--profile', nargs='?', const='profile-artifacts', metavar='DIR',
+                        help="开启性能剖析并把结果写入DIR (默认 profile-artifacts)")
+    phase = parser.add_mutually_exclusive_group()
+    phase.add_argument('--prepare', metavar='ARTIFACT', help="准备阶段：获取并渲染报告，写入产物文件")
+    phase.add_argument('--send-prepared', metavar='ARTIFACT', help="发送阶段：读取产物文件并投递")
+    parser.add_argument('--send-at', metavar='HH:MM', help="发送阶段的目标时间 (UTC)，默认立即发送")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    with profile_run(args.profile):
+        if args.prepare:
+            prepare(args.prepare)
+        elif args.send_prepared:
+            send_prepared(args.send_prepared, args.send_at)
+        else:
+            main()
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+两阶段投递：提前准备，准点发送
+
+prepare 阶段获取数据并渲染邮件，把待发送的邮件模板写成一个紧凑的产物文件
+（gzip 压缩：第一行为 JSON 元数据，其后为渲染好的邮件字节）。
+send 阶段读取产物，等到目标时间后直接投递，不再请求任何上游接口；
+产物的有效期在真正投递前检查，目标时间已过时立即发送，不会顺延到第二天。
+"""
+import gzip
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+ARTIFACT_VERSION = 1
+
+
+class StaleArtifact(Exception):
+    """产物已过期或与当前机器人不匹配"""
+
+
+def write_artifact(path, bot, template, **meta):
+    """写入产物文件，meta 中可附带主题、日期等信息"""
+    header = dict(meta, version=ARTIFACT_VERSION, bot=bot, created_at=time.time(), size=len(template))
+    with gzip.open(path, 'wb', compresslevel=6) as f:
+        f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+        f.write(template)
+    print(f"📦 已写入待发送产物: {path} ({len(template) / 1024:.1f} KiB)")
+
+
+def load_artifact(path, bot, max_age=None):
+    """
+    读取产物，返回 (模板字节, 元数据)
+    文件不存在时抛出 FileNotFoundError；不匹配或（给定 max_age 时）已过期时抛出 StaleArtifact
+    """
+    with gzip.open(path, 'rb') as f:
+        header = json.loads(f.readline())
+        template = f.read()
+
+    if header.get('version') != ARTIFACT_VERSION or header.get('bot') != bot:
+        raise StaleArtifact(f"产物 {path} 不是 {bot} 生成的 (version={header.get('version')}, bot={header.get('bot')})")
+    if len(template) != header.get('size'):
+        raise StaleArtifact(f"产物 {path} 内容不完整")
+    if max_age is not None:
+        ensure_fresh(path, header, max_age)
+
+    print(f"📦 已读取待发送产物: {path} (生成于 {time.time() - header['created_at']:.0f} 秒前)")
+    return template, header
+
+
+def ensure_fresh(path, header, max_age):
+    """产物超过有效期时抛出 StaleArtifact；应在即将投递时调用，而不是读取时"""
+    age = time.time() - header['created_at']
+    if age > max_age:
+        raise StaleArtifact(f"产物 {path} 已生成 {age / 60:.0f} 分钟，超过有效期 {max_age / 60:.0f} 分钟")
+
+
+def seconds_until(send_at, now=None):
+    """
+    计算距离 UTC 时间 HH:MM 还有多少秒
+    取离 now 最近的那一次 HH:MM（前后各 12 小时以内）：已经过去时返回 0 立即发送，
+    不会顺延到第二天；只有像 23:40 准备、00:10 发送这样跨过午夜的目标才落在第二天
+    """
+    now = now or datetime.now(timezone.utc)
+    hour, minute = (int(part) for part in send_at.split(':'))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target - now > timedelta(hours=12):
+        target -= timedelta(days=1)
+    elif now - target > timedelta(hours=12):
+        target += timedelta(days=1)
+    return max(0.0, (target - now).total_seconds())
+
+
+def wait_until(send_at):
+    """等待到 UTC 时间 HH:MM，send_at 为空时立即返回"""
+    if not send_at:
+        return
+    delay = seconds_until(send_at)
+    if delay > 0:
+        print(f"⏳ 等待 {delay:.0f} 秒，准点于 {send_at} UTC 发送")
+        time.sleep(delay)
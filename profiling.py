@@ -0,0 +1,167 @@
+"""
+运行期性能剖析
+
+用 cProfile 和 tracemalloc 包裹一次完整运行，按流程阶段（JWT签名、接口请求、
+渲染、SMTP发送等）统计耗时与内存分配，并把结果写入产物目录:
+
+    profile.pstats      cProfile 原始数据，可用 snakeviz / pstats 查看
+    profile.txt         按累计耗时排序的函数列表
+    stacks.collapsed    采样得到的折叠调用栈，可直接交给 flamegraph.pl / speedscope
+    allocations.txt     tracemalloc 统计的内存分配大户
+    stages.json         各阶段的耗时、CPU时间与内存增量
+"""
+import cProfile
+import contextlib
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+_active = None
+
+
+@contextlib.contextmanager
+def stage(name):
+    """标记一个流程阶段，未开启剖析时几乎没有开销；只统计被剖析的主线程"""
+    profiler = _active
+    if profiler is None or threading.get_ident() != profiler._thread_id:
+        yield
+        return
+    profiler._enter_stage(name)
+    try:
+        yield
+    finally:
+        profiler._exit_stage()
+
+
+def profile_run(artifact_dir):
+    """artifact_dir 为空时返回空上下文，否则返回 RunProfiler"""
+    if not artifact_dir:
+        return contextlib.nullcontext()
+    return RunProfiler(artifact_dir)
+
+
+class RunProfiler:
+    """一次运行的剖析器，作为上下文管理器使用"""
+
+    def __init__(self, artifact_dir, interval=0.005, top=30):
+        self.artifact_dir = artifact_dir
+        self.interval = interval
+        self.top = top
+        self.stages = {}
+        self._stack = []
+        self._samples = Counter()
+        self._profile = cProfile.Profile()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread_id = None
+
+    def __enter__(self):
+        global _active
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        self._thread_id = threading.get_ident()
+        tracemalloc.start(25)
+        self._started = time.perf_counter()
+        _active = self
+        self._sampler.start()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        self._profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        _active = None
+        elapsed = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self._write_pstats()
+        self._write_collapsed()
+        self._write_allocations(snapshot)
+        self._write_stages(elapsed, peak)
+        print(f"🔬 剖析结果已写入: {self.artifact_dir}")
+        return False
+
+    def _stage_path(self):
+        return '/'.join(entry['name'] for entry in self._stack)
+
+    def _enter_stage(self, name):
+        self._stack.append({
+            'name': name,
+            'wall': time.perf_counter(),
+            'cpu': time.process_time(),
+            'memory': tracemalloc.get_traced_memory()[0],
+        })
+
+    def _exit_stage(self):
+        path = self._stage_path()
+        entry = self._stack.pop()
+        stats = self.stages.setdefault(path, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'memory_delta_bytes': 0})
+        stats['calls'] += 1
+        stats['wall_seconds'] += time.perf_counter() - entry['wall']
+        stats['cpu_seconds'] += time.process_time() - entry['cpu']
+        stats['memory_delta_bytes'] += tracemalloc.get_traced_memory()[0] - entry['memory']
+
+    def _sample_loop(self):
+        """定时采样主线程调用栈，生成折叠栈格式数据"""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            names.reverse()
+            path = self._stage_path() or 'other'
+            self._samples[';'.join([f"[{path}]"] + names)] += 1
+
+    def _write_pstats(self):
+        self._profile.dump_stats(os.path.join(self.artifact_dir, 'profile.pstats'))
+        buffer = io.StringIO()
+        pstats.Stats(self._profile, stream=buffer).sort_stats('cumulative').print_stats(60)
+        with open(os.path.join(self.artifact_dir, 'profile.txt'), 'w', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+
+    def _write_collapsed(self):
+        with open(os.path.join(self.artifact_dir, 'stacks.collapsed'), 'w', encoding='utf-8') as f:
+            for stack, count in self._samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def _write_allocations(self, snapshot):
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        with open(os.path.join(self.artifact_dir, 'allocations.txt'), 'w', encoding='utf-8') as f:
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                f.write(f"{stat}\n")
+            f.write("\n# 按调用栈聚合的前5项\n")
+            for stat in snapshot.statistics('traceback')[:5]:
+                f.write(f"\n{stat.count} 个内存块, {stat.size / 1024:.1f} KiB\n")
+                for line in stat.traceback.format():
+                    f.write(f"{line}\n")
+
+    def _write_stages(self, elapsed, peak):
+        report = {
+            'total_wall_seconds': elapsed,
+            'peak_traced_bytes': peak,
+            'samples': sum(self._samples.values()),
+            'stages': self.stages,
+        }
+        with open(os.path.join(self.artifact_dir, 'stages.json'), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+        print("⏱️  各阶段耗时:")
+        for path, stats in self.stages.items():
+            print(f"   {path}: {stats['wall_seconds'] * 1000:.1f}ms "
+                  f"(CPU {stats['cpu_seconds'] * 1000:.1f}ms, 内存 {stats['memory_delta_bytes'] / 1024:+.1f} KiB)")
@@ -0,0 +1,199 @@
+"""
+流式收件人来源
+
+支持逗号分隔的环境变量以及 CSV / JSONL / SQLite 文件，逐条惰性读取，
+边读边做规范化、语法校验和去重，投递端按批次消费，十万级名单也不需要整体载入内存。
+去重只保存每个地址的 64 位摘要，存放在一个临时 SQLite 表（主键索引）中，
+页缓存限制为 DEDUP_CACHE_KIB，超出的部分写入临时文件，内存占用不随名单规模增长。
+"""
+import csv
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from itertools import islice
+
+DEFAULT_SQLITE_QUERY = "SELECT email FROM recipients"
+DEDUP_CACHE_KIB = 2048
+
+_LABEL = r'[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?'
+_EMAIL_PATTERN = re.compile(
+    r"^[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]{1,64}@" + _LABEL + r'(?:\.' + _LABEL + r')+$'
+)
+
+
+def normalize_address(raw):
+    """去掉空白和尖括号，域名部分转为小写"""
+    address = raw.strip().strip('<>').strip()
+    local, sep, domain = address.rpartition('@')
+    if not sep:
+        return address
+    return f"{local}@{domain.lower()}"
+
+
+def is_valid_address(address):
+    return len(address) <= 254 and _EMAIL_PATTERN.match(address) is not None
+
+
+class _MalformedEntry:
+    """无法解析的原始条目，交给 RecipientStream 计为无效地址"""
+
+    def __init__(self, description):
+        self.description = description
+
+    def __str__(self):
+        return self.description
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        column = None
+        for row in reader:
+            if not row:
+                continue
+            if column is None:
+                # 地址列：表头中的 email 列，否则为第一个含 @ 的单元格所在列
+                with_at = [index for index, cell in enumerate(row) if '@' in cell]
+                if with_at:
+                    column = with_at[0]
+                elif reader.line_num == 1:
+                    lowered = [cell.strip().lower() for cell in row]
+                    if 'email' in lowered:
+                        column = lowered.index('email')
+                    continue
+                else:
+                    yield row[0]
+                    continue
+            if column < len(row):
+                yield row[column]
+
+
+def _read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                yield _MalformedEntry(f"第{number}行JSON无法解析")
+                continue
+            if isinstance(entry, dict):
+                entry = entry.get('email', '')
+            yield entry
+
+
+def _read_sqlite(path, query):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(query)
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0]
+    finally:
+        conn.close()
+
+
+def read_recipient_file(path, query=None):
+    """按扩展名惰性读取收件人文件中的原始地址"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return _read_csv(path)
+    if ext == '.jsonl':
+        return _read_jsonl(path)
+    if ext in ('.db', '.sqlite', '.sqlite3'):
+        return _read_sqlite(path, query or DEFAULT_SQLITE_QUERY)
+    raise ValueError(f"不支持的收件人文件格式: {path}")
+
+
+class _SeenDigests:
+    """基于临时 SQLite 表的去重集合，内存占用受页缓存上限约束"""
+
+    def __init__(self, cache_kib=DEDUP_CACHE_KIB):
+        # 空文件名表示私有临时数据库，关闭连接后自动删除
+        self._conn = sqlite3.connect('')
+        self._conn.execute(f"PRAGMA cache_size = -{int(cache_kib)}")
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("CREATE TABLE seen (digest INTEGER PRIMARY KEY)")
+
+    def add(self, address):
+        """记录地址，已存在时返回 False"""
+        digest = hashlib.blake2b(address.lower().encode('utf-8'), digest_size=8).digest()
+        key = int.from_bytes(digest, 'little', signed=True)
+        return self._conn.execute("INSERT OR IGNORE INTO seen VALUES (?)", (key,)).rowcount == 1
+
+    def close(self):
+        self._conn.close()
+
+
+class RecipientStream:
+    """对原始地址做规范化、校验和去重的可迭代对象，只能迭代一次"""
+
+    def __init__(self, raw_addresses):
+        self._raw = raw_addresses
+        self.count = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.invalid_samples = []
+
+    def __iter__(self):
+        seen = _SeenDigests()
+        try:
+            for raw in self._raw:
+                if raw is None or raw == '':
+                    continue
+                if not isinstance(raw, str):
+                    self._record_invalid(str(raw))
+                    continue
+                if not raw.strip():
+                    continue
+                address = normalize_address(raw)
+                if not is_valid_address(address):
+                    self._record_invalid(address)
+                    continue
+
+                if not seen.add(address):
+                    self.duplicates += 1
+                    continue
+                self.count += 1
+                yield address
+        finally:
+            seen.close()
+
+    def _record_invalid(self, sample):
+        self.invalid += 1
+        if len(self.invalid_samples) < 10:
+            self.invalid_samples.append(sample)
+
+    def print_summary(self):
+        print(f"📋 收件人: 有效 {self.count} 个，重复 {self.duplicates} 个，无效 {self.invalid} 个")
+        if self.invalid_samples:
+            print(f"⚠️  无效地址示例: {', '.join(self.invalid_samples)}")
+
+
+def recipient_source(path=None, inline='', query=None):
+    """
+    创建收件人流：配置了文件路径时从文件读取，否则使用逗号分隔的字符串或列表
+    """
+    if path:
+        return RecipientStream(read_recipient_file(path, query))
+    if isinstance(inline, str):
+        inline = inline.split(',')
+    return RecipientStream(inline)
+
+
+def batched(iterable, size):
+    """把可迭代对象切成长度不超过 size 的列表"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
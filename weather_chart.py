@@ -0,0 +1,222 @@
+"""
+天气预报温度与降水趋势图
+
+纯 Python 实现的 PNG 渲染（zlib + 手写像素绘制），不依赖网络、GPU 或第三方绘图库。
+图片按解析后预报数据的内容哈希缓存到磁盘，缓存内容就是已经 base64 编码好的 MIME 正文，
+同一份预报在所有收件人和重复运行之间只渲染、编码一次，并以 cid: 内联图片的形式附加到邮件中。
+"""
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import zlib
+from email.mime.nonmultipart import MIMENonMultipart
+
+CHART_CID_PREFIX = 'weather-chart'
+CHART_VERSION = 1
+
+WIDTH, HEIGHT = 600, 260
+PLOT_LEFT, PLOT_RIGHT = 30, 570
+TEMP_TOP, TEMP_BOTTOM = 12, 160
+RAIN_TOP, RAIN_BOTTOM = 172, 222
+LABEL_PADDING = 24
+
+BACKGROUND = (255, 255, 255)
+GRID = (235, 238, 242)
+HIGH = (225, 112, 85)
+LOW = (116, 185, 255)
+RAIN_FILL = (214, 232, 250)
+RAIN_EDGE = (116, 185, 255)
+LABEL = (99, 110, 114)
+
+# 3x5 点阵字体，绘制时放大
+_GLYPHS = {
+    '0': ('111', '101', '101', '101', '111'),
+    '1': ('010', '110', '010', '010', '111'),
+    '2': ('111', '001', '111', '100', '111'),
+    '3': ('111', '001', '111', '001', '111'),
+    '4': ('101', '101', '111', '001', '001'),
+    '5': ('111', '100', '111', '001', '111'),
+    '6': ('111', '100', '111', '101', '111'),
+    '7': ('111', '001', '001', '001', '001'),
+    '8': ('111', '101', '111', '101', '111'),
+    '9': ('111', '101', '111', '001', '111'),
+    '-': ('000', '000', '111', '000', '000'),
+    '.': ('000', '000', '000', '000', '010'),
+    '°': ('111', '101', '111', '000', '000'),
+    'm': ('000', '000', '111', '111', '101'),
+    ' ': ('000', '000', '000', '000', '000'),
+}
+
+_memory_cache = {}
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def chart_series(weather_data):
+    """从 parse_weather_data 的结果中提取绘图所需的数据"""
+    return [
+        (day['日期'], _number(day['最高温度']), _number(day['最低温度']), _number(day['当天总降水量']))
+        for day in weather_data
+    ]
+
+
+def chart_key(weather_data):
+    """预报内容的哈希，用作缓存键"""
+    payload = json.dumps([CHART_VERSION, chart_series(weather_data)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def chart_cid(weather_data, sender=None):
+    """
+    图表的 Content-ID（不含尖括号，HTML 中以 cid: 引用），格式为 weather-chart.<内容哈希>@<发件域名>，
+    按 RFC 2392 / RFC 5322 的 msg-id 要求带上域名部分
+    """
+    domain = (sender or '').rpartition('@')[2] or socket.getfqdn()
+    return f"{CHART_CID_PREFIX}.{chart_key(weather_data)[:16]}@{domain}"
+
+
+class _Canvas:
+    """RGB 像素画布"""
+
+    def __init__(self, width, height, color):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(bytes(color) * (width * height))
+
+    def set(self, x, y, color):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            offset = (y * self.width + x) * 3
+            self.pixels[offset:offset + 3] = bytes(color)
+
+    def rect(self, x0, y0, x1, y1, color):
+        x0, x1 = max(0, int(x0)), min(self.width, int(x1))
+        row = bytes(color) * max(0, x1 - x0)
+        for y in range(max(0, int(y0)), min(self.height, int(y1))):
+            offset = (y * self.width + x0) * 3
+            self.pixels[offset:offset + len(row)] = row
+
+    def disc(self, cx, cy, radius, color):
+        r2 = radius * radius
+        for dy in range(-int(radius), int(radius) + 1):
+            for dx in range(-int(radius), int(radius) + 1):
+                if dx * dx + dy * dy <= r2:
+                    self.set(int(round(cx + dx)), int(round(cy + dy)), color)
+
+    def line(self, x0, y0, x1, y1, color, width=3):
+        steps = int(max(abs(x1 - x0), abs(y1 - y0))) or 1
+        for i in range(steps + 1):
+            t = i / steps
+            self.disc(x0 + (x1 - x0) * t, y0 + (y1 - y0) * t, width / 2, color)
+
+    def text(self, cx, top, text, color, scale=2):
+        """以 cx 为水平中心绘制点阵文字"""
+        width = len(text) * 4 * scale - scale
+        left = int(cx - width / 2)
+        for index, char in enumerate(text):
+            glyph = _GLYPHS.get(char, _GLYPHS[' '])
+            for row, bits in enumerate(glyph):
+                for col, bit in enumerate(bits):
+                    if bit == '1':
+                        x = left + (index * 4 + col) * scale
+                        y = top + row * scale
+                        self.rect(x, y, x + scale, y + scale, color)
+
+    def to_png(self):
+        stride = self.width * 3
+        raw = b''.join(
+            b'\x00' + bytes(self.pixels[y * stride:(y + 1) * stride]) for y in range(self.height)
+        )
+
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        header = struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)
+        return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 9)) + chunk(b'IEND', b'')
+
+
+def render_chart_png(weather_data):
+    """绘制温度折线与降水柱状图，返回 PNG 字节"""
+    series = chart_series(weather_data)
+    canvas = _Canvas(WIDTH, HEIGHT, BACKGROUND)
+
+    highs = [high for _, high, _, _ in series]
+    lows = [low for _, _, low, _ in series]
+    t_low, t_high = min(lows), max(highs)
+    t_span = (t_high - t_low) or 1.0
+    temp_height = TEMP_BOTTOM - TEMP_TOP - 2 * LABEL_PADDING
+    rain_height = RAIN_BOTTOM - RAIN_TOP - 16
+    column = (PLOT_RIGHT - PLOT_LEFT) / len(series)
+    rain_scale = max(10.0, max(rain for _, _, _, rain in series))
+
+    def temp_y(value):
+        return TEMP_BOTTOM - LABEL_PADDING - (value - t_low) / t_span * temp_height
+
+    for i in range(5):
+        y = TEMP_TOP + (TEMP_BOTTOM - TEMP_TOP) * i / 4
+        canvas.rect(PLOT_LEFT, y, PLOT_RIGHT, y + 1, GRID)
+    canvas.rect(PLOT_LEFT, RAIN_BOTTOM, PLOT_RIGHT, RAIN_BOTTOM + 1, GRID)
+
+    centers = [PLOT_LEFT + column * (i + 0.5) for i in range(len(series))]
+
+    # 降水柱
+    for cx, (date, _, _, rain) in zip(centers, series):
+        bar_height = rain / rain_scale * rain_height
+        half = column * 0.18
+        if rain > 0:
+            canvas.rect(cx - half, RAIN_BOTTOM - bar_height, cx + half, RAIN_BOTTOM, RAIN_FILL)
+            canvas.rect(cx - half, RAIN_BOTTOM - bar_height, cx + half, RAIN_BOTTOM - bar_height + 2, RAIN_EDGE)
+        canvas.text(cx, int(RAIN_BOTTOM - bar_height - 14), f"{rain:g}mm", RAIN_EDGE)
+        canvas.text(cx, RAIN_BOTTOM + 14, date[5:], LABEL)
+
+    # 温度折线
+    for values, color in ((highs, HIGH), (lows, LOW)):
+        points = [(cx, temp_y(value)) for cx, value in zip(centers, values)]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            canvas.line(x0, y0, x1, y1, color)
+        for (x, y), value in zip(points, values):
+            canvas.disc(x, y, 5, color)
+            top = y - 22 if color == HIGH else y + 10
+            canvas.text(x, int(top), f"{value:g}°", color)
+
+    return canvas.to_png()
+
+
+def encoded_chart(weather_data, cache_dir):
+    """返回 base64 编码（按 MIME 规范换行）的图表，先查内存再查磁盘缓存"""
+    key = chart_key(weather_data)
+    if key in _memory_cache:
+        return _memory_cache[key]
+
+    path = os.path.join(cache_dir, f"{key}.b64") if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path, encoding='ascii') as f:
+            encoded = f.read()
+    else:
+        encoded = base64.encodebytes(render_chart_png(weather_data)).decode('ascii')
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='ascii') as f:
+                f.write(encoded)
+            os.replace(tmp_path, path)
+
+    _memory_cache[key] = encoded
+    return encoded
+
+
+def chart_part(weather_data, cache_dir, cid):
+    """生成可直接附加到 multipart/related 中的内联图片，正文复用缓存中的 base64 内容，cid 来自 chart_cid"""
+    part = MIMENonMultipart('image', 'png')
+    part.set_payload(encoded_chart(weather_data, cache_dir))
+    part['Content-Transfer-Encoding'] = 'base64'
+    part['Content-ID'] = f"<{cid}>"
+    part['Content-Disposition'] = 'inline; filename="weather-chart.png"'
+    return part